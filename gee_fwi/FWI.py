@@ -1,7 +1,63 @@
 import ee
 import eemont
+import math
 import datetime
 
+# Natural log of 10, used to express 10 ** x as exp(x * ln 10)
+_LN_10 = math.log(10.0)
+
+# Latitude image shared by the monthly stacks, built on first use
+# because ee.Image.pixelLonLat() needs an initialized client
+_latitude = None
+
+def _get_latitude():
+    """
+    Returns the cached per-pixel latitude ee.Image
+    """
+    global _latitude
+    if _latitude is None:
+        _latitude = ee.Image.pixelLonLat().select('latitude')
+    return _latitude
+
+def _as_image(value):
+    """
+    Returns value as an ee.Image, leaving existing images untouched
+    """
+    return value if isinstance(value, ee.Image) else ee.Image(value)
+
+def _literal(value, name, terms):
+    """
+    Returns a client-side number as an expression literal, since
+    ee.Image.expression turns every value in its map into a constant
+    image, or binds any other value to name in terms
+    """
+    if isinstance(value, (int, float)):
+        literal = repr(float(value))
+        return f'({literal})' if value < 0 else literal
+    terms[name] = value
+    return name
+
+def _month_index(obs):
+    """
+    Returns the zero-based month of obs, as an int for a datetime.date
+    or as a server-side ee.Number for an ee.Date
+    """
+    if isinstance(obs, datetime.date):
+        return obs.month - 1
+    return ee.Date(obs).get('month').subtract(1)
+
+class _ImageInputs:
+    """
+    Daily weather inputs read from the T, H, W and R bands of a single
+    ee.Image, used when iterating over an ee.ImageCollection
+    """
+
+    def __init__(self, image):
+        self.temp = image.select('T')
+        self.rhum = image.select('H')
+        self.wind = image.select('W')
+        self.rain = image.select('R')
+
 class FineFuelMoistureCode:
     """
     Fine Fuel Moisture Code Calculation
@@ -25,7 +81,7 @@ class FineFuelMoistureCode:
         ffmc_prev : int or ee.Image
             yesterday's fine fuel moisture code
         """
-        self.ffmc_prev = ee.Image(ffmc_prev)
+        self.ffmc_prev = _as_image(ffmc_prev)
         self.temp = inputs.temp
         self.rhum = inputs.rhum
         self.wind = inputs.wind
@@ -33,68 +89,67 @@ class FineFuelMoistureCode:
 
     def __raining_phase(self):
         # Convert FFMC to moisture content
-        m_o = 147.2 * (101.0 - self.ffmc_prev) / \
-            (59.5 + self.ffmc_prev)
-
-        # Calculate effective rain
-        rain_mask = self.rain.gt(0.5)
-        negligible = rain_mask.Not()
-        r_f = rain_mask * (self.rain - 0.5)
-
-        # Calculate moisture change
-        comp_mask = m_o.gt(150.0)
-        normal = comp_mask.Not()
-
-        delta_m_rain = 42.5 * (-100.0 / (251 - m_o)).exp() * \
-            (1 - (-6.93 / r_f).exp()) * r_f
-        corrective = 0.0015 * (m_o - 150.0) ** 2 * r_f ** 0.5
-
-        delta_m_c = delta_m_rain + corrective
-        delta_m_r = delta_m_rain
-        delta_m_n = 0.0 * negligible
-        delta_m = rain_mask * ( comp_mask * delta_m_c + \
-            normal * delta_m_r) + delta_m_n
-
-        # Moisture content after rain
-        self.mo = (m_o + delta_m).min(ee.Image(250.0))
+        m_o = self.ffmc_prev.expression(
+            '147.2 * (101.0 - F) / (59.5 + F)', {'F': self.ffmc_prev})
+
+        # Moisture content after rain, corrected above 150 and
+        # unchanged on negligible rain
+        self.mo = m_o.expression(
+            'min(r_f > 0.0 ? m_o + 42.5 * r_f * ' \
+            'exp(-100.0 / (251.0 - m_o)) * (1.0 - exp(-6.93 / r_f)) + ' \
+            '(m_o > 150.0 ? 0.0015 * (m_o - 150.0) * (m_o - 150.0) * ' \
+            'sqrt(r_f) : 0.0) : m_o, 250.0)', {
+                'm_o': m_o, 'r_f': self.rain - 0.5})
 
     def __drying_phase(self):
-        # Equilibrium moisture content for drying and wetting phase
-        E_d = 0.942 * self.rhum ** 0.679 + \
-            11.0 * ((self.rhum - 100) / 10).exp() + \
-            0.18 * (21.1 - self.temp) * \
-            (1 - (-0.115 * self.rhum).exp())
+        # Terms shared by the drying and wetting equations, bound
+        # once and passed to each expression
+        rh_frac = self.rhum / 100
+        terms = {
+            'mo': self.mo,
+            'H': self.rhum,
+            'rh_exp': ((self.rhum - 100) / 10).exp(),
+            'temp_term': 0.18 * (21.1 - self.temp) * \
+                (1 - (-0.115 * self.rhum).exp()),
+            'rh_frac': rh_frac,
+            'rh_deficit': 1 - rh_frac,
+            'wind_sqrt': self.wind.sqrt(),
+            'temp_factor': 0.581 * (0.0365 * self.temp).exp(),
+        }
+
+        # Fourth powers by multiplication, squared again for the ** 8
+        # terms of the drying and wetting rates
+        terms['rh_frac_4'] = self.rhum.expression(
+            'rh_frac * rh_frac * rh_frac * rh_frac', terms)
+        terms['rh_deficit_4'] = self.rhum.expression(
+            'rh_deficit * rh_deficit * rh_deficit * rh_deficit', terms)
 
-        E_w = 0.618 * self.rhum ** 0.753 + \
-            10.0 * ((self.rhum - 100) / 10).exp() + \
-            0.18 * (21.1 - self.temp) * \
-            (1 - (-0.115 * self.rhum).exp())
+        # Equilibrium moisture content for drying and wetting phase
+        terms['E_d'] = self.rhum.expression(
+            '0.942 * H ** 0.679 + 11.0 * rh_exp + temp_term', terms)
+        terms['E_w'] = self.rhum.expression(
+            '0.618 * H ** 0.753 + 10.0 * rh_exp + temp_term', terms)
 
         # Calculate the log drying/wetting rate
-        k_1 = 0.424 * (1 - ((100 - self.rhum) / 100) ** 1.7) + \
-            0.0694 * self.wind ** 0.5 * \
-            (1 - ((100 - self.rhum) / 100) ** 8)
-        k_0 = 0.424 * (1 - (self.rhum / 100) ** 1.7) + \
-            0.0694 * self.wind ** 0.5 * \
-            (1 - (self.rhum / 100) ** 8)
-        k_d = k_0 * 0.581 * (0.0365 * self.temp).exp()
-        k_w = k_1 * 0.581 * (0.0365 * self.temp).exp()
-
-        # Wetting and drying conditions
-        drying = self.mo.gt(E_d)
-        wetting = self.mo.lt(E_w)
-        no_change = (drying + wetting).Not()
-
-        # Moisture content after drying
-        m_drying = drying * (E_d + (self.mo - E_d) / 10 ** k_d)
-        m_wetting = wetting * (E_w - (E_w - self.mo) / 10 ** k_w)
-        m_no_change = no_change * self.mo
-        m = m_drying + m_wetting + m_no_change
+        terms['k_d'] = self.rhum.expression(
+            '(0.424 * (1 - rh_frac ** 1.7) + 0.0694 * wind_sqrt * ' \
+            '(1 - rh_frac_4 * rh_frac_4)) * temp_factor', terms)
+        terms['k_w'] = self.rhum.expression(
+            '(0.424 * (1 - rh_deficit ** 1.7) + 0.0694 * wind_sqrt * ' \
+            '(1 - rh_deficit_4 * rh_deficit_4)) * temp_factor', terms)
+
+        # Moisture content after drying, wetting or no change,
+        # 10 ** -k evaluated as an exp
+        ln_10 = repr(_LN_10)
+        m = self.mo.expression(
+            f'mo > E_d ? E_d + (mo - E_d) * exp(-{ln_10} * k_d) : ' \
+            f'(mo < E_w ? E_w - (E_w - mo) * exp(-{ln_10} * k_w) : mo)', \
+            terms)
 
         # Calculate today's Fine Fuel Moisture Code
-        self.ffmc = (59.5 * (250.0 - m) / (147.2 + m)) \
-            .min(ee.Image(101.0)).rename( \
-            'fine_fuel_moisture_code')
+        self.ffmc = m.expression(
+            'min(59.5 * (250.0 - m) / (147.2 + m), 101.0)', {'m': m}) \
+            .rename('fine_fuel_moisture_code')
     
     def compute(self):
         self.__raining_phase()
@@ -113,96 +168,101 @@ class DuffMoistureCode:
         yesterday's duff moisture code
     equatorial : bool
         use equatorial mode to calculate day length
-    obs : datetime.date
+    obs : datetime.date or ee.Date
         observed date
     """
 
-    def __init__(self, inputs, dmc_prev, obs, equatorial=True):
+    # Monthly day length approximations by latitude band
+    DayLength46N = [ 6.5,  7.5,  9.0, 12.8, 13.9, 13.9, \
+                    12.4, 10.9,  9.4,  8.0,  7.0,  6.0]
+    DayLength20N = [ 7.9,  8.4,  8.9,  9.5,  9.9, 10.2, \
+                    10.1,  9.7,  9.1,  8.6,  8.1,  7.8]
+    DayLength20S = [10.1,  9.6,  9.1,  8.5,  8.1,  7.8, \
+                    7.9,  8.3,  8.9,  9.4,  9.9, 10.2]
+    DayLength40S = [11.5, 10.5,  9.2,  7.9,  6.8,  6.2, \
+                    6.5,  7.4,  8.7, 10.0, 11.2, 11.8]
+
+    # 12-band day length image, built on first use
+    _day_length_stack = None
+
+    def __init__(self, inputs, dmc_prev, obs, equatorial=True, \
+            day_length=None):
         """
-        Initializes the DMC calculation
+        Initializes the DMC calculation, day_length skips the monthly
+        lookup when already known
         """
-        self.dmc_prev = ee.Image(dmc_prev)
+        self.dmc_prev = _as_image(dmc_prev)
 
         self.temp = inputs.temp
         self.rhum = inputs.rhum
         self.rain = inputs.rain
         self.obs = obs
         self.equatorial = equatorial
+        self.day_length = day_length
         
-    def __get_day_length(self):
-        if self.equatorial:
-            self.day_length = ee.Image(9.0)
-        else:
-            self.__calculate_day_length()
-    
-    def __calculate_day_length(self):
+    @classmethod
+    def _get_day_length_stack(cls):
         '''
-        Calculates an ee.Image containing an approximation
-        of the day length with date
+        Returns a 12-band ee.Image with an approximation of the
+        day length for every month, one band per month
         '''
-        DayLength46N = [ 6.5,  7.5,  9.0, 12.8, 13.9, 13.9, \
-                        12.4, 10.9,  9.4,  8.0,  7.0,  6.0]
-        DayLength20N = [ 7.9,  8.4,  8.9,  9.5,  9.9, 10.2, \
-                        10.1,  9.7,  9.1,  8.6,  8.1,  7.8]
-        DayLength20S = [10.1,  9.6,  9.1,  8.5,  8.1,  7.8, \
-                        7.9,  8.3,  8.9,  9.4,  9.9, 10.2]
-        DayLength40S = [11.5, 10.5,  9.2,  7.9,  6.8,  6.2, \
-                        6.5,  7.4,  8.7, 10.0, 11.2, 11.8]
-
-        latitude = ee.Image.pixelLonLat() \
-            .select('latitude')
-
-        mask_1 = latitude.lte(90.0) * latitude.gt(33.0)
-        mask_2 = latitude.lte(33.0) * latitude.gt(0)
-        mask_3 = latitude.lte(0) * latitude.gt(-30.0)
-        mask_4 = latitude.lte(-30.0) * latitude.gt(-90.0)
-
-        index = self.obs.month - 1
-        length_1 = mask_1 * ee.Image(DayLength46N[index])
-        length_2 = mask_2 * ee.Image(DayLength20N[index])
-        length_3 = mask_3 * ee.Image(DayLength20S[index])
-        length_4 = mask_4 * ee.Image(DayLength40S[index])
-        self.day_length = length_1 + length_2 + length_3 + length_4
+        if cls._day_length_stack is None:
+            latitude = _get_latitude()
+
+            # Latitude band lookup, one expression per month
+            months = []
+            for index in range(12):
+                terms = {'l': latitude}
+                a = _literal(cls.DayLength46N[index], 'a', terms)
+                b = _literal(cls.DayLength20N[index], 'b', terms)
+                c = _literal(cls.DayLength20S[index], 'c', terms)
+                d = _literal(cls.DayLength40S[index], 'd', terms)
+                months.append(latitude.expression(
+                    f'l > 33.0 ? {a} : (l > 0.0 ? {b} : ' \
+                    f'(l > -30.0 ? {c} : {d}))', terms) \
+                    .rename(f'month_{index + 1}'))
+            cls._day_length_stack = ee.Image(months)
+        return cls._day_length_stack
+
+    @classmethod
+    def get_day_length(cls, obs, equatorial=True):
+        """
+        Returns the day length of the month of obs, a constant in
+        equatorial mode
+        """
+        if equatorial:
+            return 9.0
+        return cls._get_day_length_stack().select([_month_index(obs)])
 
     def __raining_phase(self):
         # Convert DMC to moisture content
-        M_o = 20.0 + 280.0 / (0.023 * self.dmc_prev).exp()
-
-        # Calculate effective rain
-        rain_mask = self.rain.gt(1.5)
-        negligible = rain_mask.Not()
-        r_e = (0.92 * self.rain - 1.27).updateMask(rain_mask)
+        M_o = self.dmc_prev.expression(
+            '20.0 + 280.0 / exp(0.023 * P)', {'P': self.dmc_prev})
 
         # Piecewise equation
-        pw_1 = self.dmc_prev.lte(33.0)
-        pw_2 = self.dmc_prev.lte(65.0) * self.dmc_prev.gt(33.0)
-        pw_3 = self.dmc_prev.gt(65.0)
-        b_1 = (100.0 / (0.5 + 0.3 * self.dmc_prev)) * pw_1
-        b_2 = (14.0 - 1.3 * self.dmc_prev.log()) * pw_2
-        b_3 = (6.2 * self.dmc_prev.log() - 17.2) * pw_3
-        b = b_1 + b_2 + b_3
-
-        M_r = (M_o + 1000.0 * r_e / (48.77 + b * r_e)) \
-            .updateMask(rain_mask).rename('M')
-        M_n = (M_o).updateMask(negligible).rename('M')
-        M = ee.ImageCollection([M_r, M_n]).max()
-
-        self.P_rain = (244.72 - 43.43 * (M - 20.0).log()) \
-            .max(ee.Image(0.0))
+        b = self.dmc_prev.expression(
+            'P <= 33.0 ? 100.0 / (0.5 + 0.3 * P) : ' \
+            '(P <= 65.0 ? 14.0 - 1.3 * log_P : 6.2 * log_P - 17.2)', {
+                'P': self.dmc_prev, 'log_P': self.dmc_prev.log()})
+
+        # DMC after rain, yesterday's DMC on negligible rain
+        self.P_rain = M_o.expression(
+            'R > 1.5 ? max(244.72 - 43.43 * ' \
+            'log(M_o + 1000.0 * r_e / (48.77 + b * r_e) - 20.0), 0.0) : P', {
+                'R': self.rain, 'r_e': 0.92 * self.rain - 1.27,
+                'M_o': M_o, 'b': b, 'P': self.dmc_prev})
     
     def __drying_phase(self):
-        log_drying = self.temp > -1.1
-        negligible = log_drying.Not()
-        self.__get_day_length()
-
-        k_d = (1.894 * (self.temp + 1.1) * (100.0 - self.rhum) \
-            * self.day_length * 1e-6).updateMask(log_drying) \
-            .rename('K')
-        k_n = ee.Image(0.0).updateMask(negligible).rename('K')
-        K = ee.ImageCollection([k_d, k_n]).max()
-
-        self.dmc = (self.P_rain + 100.0 * K) \
-            .rename('duff_moisture_code')
+        day_length = self.day_length
+        if day_length is None:
+            day_length = self.get_day_length(self.obs, self.equatorial)
+
+        # Log drying rate, no drying at or below -1.1 degree Celsius
+        terms = {'P_r': self.P_rain, 'T': self.temp, 'H': self.rhum}
+        L_e = _literal(day_length, 'L_e', terms)
+        self.dmc = self.P_rain.expression(
+            'P_r + 1.894 * max(T + 1.1, 0.0) * (100.0 - H) * ' \
+            f'{L_e} / 10000.0', terms).rename('duff_moisture_code')
         
     def compute(self):
         """
@@ -229,10 +289,21 @@ class DroughtCode:
         yesterday's drought code
     equatorial : bool
         use equatorial mode to calculate drying factor
-    obs : datetime.date
+    obs : datetime.date or ee.Date
         observed date
     """
-    def __init__(self, inputs, dc_prev, obs, equatorial=True):
+
+    # Monthly day length adjustment factors by hemisphere
+    LfN = [-1.6, -1.6, -1.6, 0.9, 3.8, 5.8, \
+           6.4, 5.0, 2.4, 0.4, -1.6, -1.6]
+    LfS = [6.4, 5.0, 2.4, 0.4, -1.6, -1.6, \
+           -1.6, -1.6, -1.6, 0.9, 3.8, 5.8]
+
+    # 12-band drying factor image, built on first use
+    _drying_factor_stack = None
+
+    def __init__(self, inputs, dc_prev, obs, equatorial=True, \
+            drying_factor=None):
         """
         Initializes the DC calculation object
 
@@ -244,72 +315,75 @@ class DroughtCode:
             yesterday's drought code
         equatorial : bool
             use equatorial mode to calculate drying factor
-        obs : datetime.date
+        obs : datetime.date or ee.Date
             observed date
+        drying_factor : float or ee.Image
+            the month's drying factor, looked up from obs when None
         """
-        self.dc_prev = ee.Image(dc_prev)
+        self.dc_prev = _as_image(dc_prev)
         self.temp = inputs.temp
         self.rain = inputs.rain
         self.obs = obs
         self.equatorial = equatorial
+        self.drying_factor = drying_factor
 
-    def __get_drying_factor(self):
-        if self.equatorial:
-            self.drying_factor = ee.Image(1.39)
-        else:
-            self.__calculate_drying_factor()
-    
-    def __calculate_drying_factor(self):
+    @classmethod
+    def _get_drying_factor_stack(cls):
         """
-        Calculates an ee.Image containing the drying
-        factor with date
+        Returns a 12-band ee.Image with the drying factor for
+        every month, one band per month
         """
+        if cls._drying_factor_stack is None:
+            latitude = _get_latitude()
 
-        latitude = ee.Image.pixelLonLat() \
-            .select('latitude')
-
-        LfN = [-1.6, -1.6, -1.6, 0.9, 3.8, 5.8, \
-               6.4, 5.0, 2.4, 0.4, -1.6, -1.6]
-        LfS = [6.4, 5.0, 2.4, 0.4, -1.6, -1.6, \
-               -1.6, -1.6, -1.6, 0.9, 3.8, 5.8]
+            # Hemisphere lookup, one expression per month
+            months = []
+            for index in range(12):
+                terms = {'l': latitude}
+                n = _literal(cls.LfN[index], 'n', terms)
+                s = _literal(cls.LfS[index], 's', terms)
+                months.append(latitude.expression(
+                    f'l > 0.0 ? {n} : {s}', terms) \
+                    .rename(f'month_{index + 1}'))
+            cls._drying_factor_stack = ee.Image(months)
+        return cls._drying_factor_stack
 
-        mask_1 = latitude.gt(0)
-        mask_2 = latitude.lte(0)
-
-        factor_1 = mask_1 * ee.Image(LfN[self.obs.month - 1])
-        factor_2 = mask_2 * ee.Image(LfS[self.obs.month - 1])
-
-        self.drying_factor = factor_1 + factor_2
+    @classmethod
+    def get_drying_factor(cls, obs, equatorial=True):
+        """
+        Returns the drying factor of the month of obs, a constant in
+        equatorial mode
+        """
+        if equatorial:
+            return 1.39
+        return cls._get_drying_factor_stack().select([_month_index(obs)])
 
     def __raining_phase(self):
         # Converts drought code to moisture content
-        Q_o = (800.0 * (-1 * self.dc_prev / 400.0).exp())
+        Q_o = self.dc_prev.expression(
+            '800.0 * exp(-D / 400.0)', {'D': self.dc_prev})
 
-        # Calculating effective rain
-        rain_mask = self.rain.gt(2.8)
-        negligible = rain_mask.Not()
-        r_d = (0.83 * self.rain - 1.27).updateMask(rain_mask)
-
-        # Calculates the moisture change
-        Q_r = (Q_o + 3.937 * r_d).updateMask(rain_mask).rename('Q')
-        Q_n = (Q_o).updateMask(negligible).rename('Q')
-        Q = ee.ImageCollection([Q_r, Q_n]).max()
-
-        self.D_rain = (400.0 * (800.0 / Q).log()).max(ee.Image(0.0))
+        # Calculates the moisture change, Q_r stays positive so only
+        # the upper bound of 800 needs the clamp, and negligible rain
+        # keeps yesterday's code without the exp/log round trip
+        self.D_rain = Q_o.expression(
+            'R > 2.8 ? max(400.0 * log(800.0 / ' \
+            '(Q_o + 3.937 * (0.83 * R - 1.27))), 0.0) : D', {
+                'R': self.rain, 'Q_o': Q_o, 'D': self.dc_prev})
 
     def __drying_phase(self):
-        drying_phase = self.temp.gt(-2.8)
-        negligible = drying_phase.Not()
-
-        self.__get_drying_factor()
-
-        # Calculates drying equation
-        V_d = (0.36 * (self.temp + 2.8) + self.drying_factor) \
-            .updateMask(drying_phase).rename('V')
-        V_n = (self.drying_factor).updateMask(negligible).rename('V')
-        V = ee.ImageCollection([V_d, V_n]).max()
-
-        self.dc = (self.D_rain + 0.5 * V).rename('drought_code')
+        drying_factor = self.drying_factor
+        if drying_factor is None:
+            drying_factor = self.get_drying_factor(self.obs, \
+                self.equatorial)
+
+        # Calculates drying equation, no temperature term at or
+        # below -2.8 degree Celsius and no negative evapotranspiration
+        terms = {'D_r': self.D_rain, 'T': self.temp}
+        L_f = _literal(drying_factor, 'L_f', terms)
+        self.dc = self.D_rain.expression(
+            f'D_r + 0.5 * max(0.36 * max(T + 2.8, 0.0) + {L_f}, 0.0)', \
+            terms).rename('drought_code')
 
     def compute(self):
         """
@@ -358,13 +432,14 @@ class InitialSpreadIndex:
         isi : ee.Image
             today's initial spread index
         """
-        f_Wind = (0.05039 * self.wind).exp()
+        m = self.ffmc.expression(
+            '147.2 * (101.0 - F) / (59.5 + F)', {'F': self.ffmc})
 
-        m = 147.2 * (101.0 - self.ffmc) / (59.5 + self.ffmc)
-        f_F = 91.9 * (-0.1386 * m).exp() * (1.0 + m ** 5.31 / \
-            (4.93 * 1e7))
-        
-        self.isi = (0.208 * f_Wind * f_F).rename('initial_spread_index')
+        # Wind function times fine fuel moisture function
+        self.isi = m.expression(
+            '0.208 * exp(0.05039 * W) * 91.9 * exp(-0.1386 * m) * ' \
+            '(1.0 + m ** 5.31 / 49300000.0)', {
+                'W': self.wind, 'm': m}).rename('initial_spread_index')
         return self.isi
 
 class BuildupIndex:
@@ -404,15 +479,14 @@ class BuildupIndex:
         isi : ee.Image
             today's initial spread index
         """
-        cond = self.dmc.lte(0.4 * self.dc)
-        not_cond = cond.Not()
-        
-        B_1 = (0.8 * self.dmc * self.dc / (self.dmc + 0.4 * self.dc)) \
-            .updateMask(cond).rename('buildup_index')
-        B_2 = (self.dmc - (1.0 - 0.8 * self.dc / (self.dmc + 0.4 * self.dc)) \
-            * (0.92 + (0.0114 * self.dmc) ** 1.7)) \
-            .updateMask(not_cond).rename('buildup_index')
-        self.bui = ee.ImageCollection([B_1, B_2]).max()
+        # Zero when both codes are zero and never negative, as in
+        # Van Wagner and Pickett (1985)
+        self.bui = self.dmc.expression(
+            'P + 0.4 * D == 0.0 ? 0.0 : max(P <= 0.4 * D ? ' \
+            '0.8 * P * D / (P + 0.4 * D) : ' \
+            'P - (1.0 - 0.8 * D / (P + 0.4 * D)) * ' \
+            '(0.92 + (0.0114 * P) ** 1.7), 0.0)', {
+                'P': self.dmc, 'D': self.dc}).rename('buildup_index')
         return self.bui
 
 class FireWeatherIndex:
@@ -450,24 +524,18 @@ class FireWeatherIndex:
         fwi : ee.Image
             today's fire weather index
         """
-        heat_transfer = self.bui.gt(80)
-        normal = heat_transfer.Not()
-
-        fD_n = (0.626 * self.bui ** 0.809 + 2.0) \
-            .updateMask(normal).rename('fD')
-        fD_h = (1000.0 / (25.0 + 108.64 * (-0.023 * self.bui).exp())) \
-            .updateMask(heat_transfer).rename('fD')
-        fD = ee.ImageCollection([fD_n, fD_h]).max()
-
-        B = 0.1 * self.isi * fD
-
-        S_scale = B.gt(1.0)
-        B_scale = S_scale.Not()
-
-        fwi_s = ((2.72 * (0.434 * B.log()) ** 0.647).exp()) \
-            .updateMask(S_scale).rename('fire_weather_index')
-        fwi_b = (B).updateMask(B_scale).rename('fire_weather_index')
-        self.fwi = ee.ImageCollection([fwi_b, fwi_s]).max()
+        # Duff moisture function, heat transfer form above 80
+        B = self.bui.expression(
+            '0.1 * R * (U > 80.0 ? ' \
+            '1000.0 / (25.0 + 108.64 * exp(-0.023 * U)) : ' \
+            '0.626 * U ** 0.809 + 2.0)', {
+                'R': self.isi, 'U': self.bui})
+
+        # S = exp(2.72 * (0.434 * ln B) ** 0.647) above 1, the 0.647
+        # power applies to the log term only
+        self.fwi = B.expression(
+            'B > 1.0 ? exp(2.72 * (0.434 * log(B)) ** 0.647) : B', {
+                'B': B}).rename('fire_weather_index')
         return self.fwi
 
 class FWICalculator:
@@ -495,6 +563,16 @@ class FWICalculator:
         today's fire weather index
     """
 
+    # Method calculating each code, in dependency order
+    _CALCULATORS = {
+        'ffmc': 'calculate_fine_fuel_moisture_code',
+        'dmc': 'calculate_duff_moisture_code',
+        'dc': 'calculate_drought_code',
+        'isi': 'calculate_initial_spread_index',
+        'bui': 'calculate_buildup_index',
+        'fwi': 'calculate_fire_weather_index',
+    }
+
     def __init__(self, obs, inputs, equatorial=True):
         """
         Constructs all the necessary attributes for the FWICalculator
@@ -506,11 +584,39 @@ class FWICalculator:
             the observation datetime
         inputs : FWIInputs
             daily observed weather inputs at noon 
+        equatorial : bool
+            use equatorial mode to calculate day length and
+            drying factor
         """
         self.obs = obs
         self.inputs = inputs
         self.equatorial = equatorial
 
+        # Day length and drying factor by (equatorial, month), reused
+        # while the calculator steps through the days of a month
+        self._day_length_cache = {}
+        self._drying_factor_cache = {}
+
+        # Start from the standard codes until set_previous_codes is
+        # called, so compute never depends on a missing attribute
+        self.set_previous_codes()
+
+    def __reset_codes(self):
+        """
+        Marks all of today's codes as not yet calculated
+        """
+        self.ffmc = self.dmc = self.dc = None
+        self.isi = self.bui = self.fwi = None
+
+    def _ensure(self, name):
+        """
+        Returns today's code by name, calculating it and its
+        prerequisites only if they have not been calculated yet
+        """
+        if getattr(self, name) is None:
+            getattr(self, self._CALCULATORS[name])()
+        return getattr(self, name)
+
     def set_previous_codes(self, ffmc_prev=85.0, dmc_prev=6.0, dc_prev=15.0):
         """
         Sets the initial value for Fine Fuel Moisture Code,
@@ -529,9 +635,10 @@ class FWICalculator:
         -------
         None
         """
-        self.ffmc_prev = ee.Image(ffmc_prev)
-        self.dmc_prev = ee.Image(dmc_prev)
-        self.dc_prev = ee.Image(dc_prev)
+        self.ffmc_prev = _as_image(ffmc_prev)
+        self.dmc_prev = _as_image(dmc_prev)
+        self.dc_prev = _as_image(dc_prev)
+        self.__reset_codes()
 
     def set_equatorial_mode(self, equatorial):
         """
@@ -548,7 +655,20 @@ class FWICalculator:
         None
         """
         self.equatorial = equatorial
+        self.__reset_codes()
     
+    def __get_monthly(self, cache, lookup):
+        """
+        Returns the monthly factor of the observed date from lookup,
+        cached per mode and month when the date is known client-side
+        """
+        if not isinstance(self.obs, datetime.date):
+            return lookup(self.obs, self.equatorial)
+        key = (self.equatorial, self.obs.month)
+        if key not in cache:
+            cache[key] = lookup(self.obs, self.equatorial)
+        return cache[key]
+
     def calculate_fine_fuel_moisture_code(self):
         """
         Calculates the fine fuel moisture code
@@ -557,23 +677,29 @@ class FWICalculator:
         self.ffmc = ffmc.compute()
     
     def calculate_duff_moisture_code(self):
-        dmc = DuffMoistureCode(self.inputs, self.dmc_prev, self.obs)
+        day_length = self.__get_monthly(self._day_length_cache, \
+            DuffMoistureCode.get_day_length)
+        dmc = DuffMoistureCode(self.inputs, self.dmc_prev, self.obs, \
+            self.equatorial, day_length)
         self.dmc = dmc.compute()
     
     def calculate_drought_code(self):
-        dc = DroughtCode(self.inputs, self.dc_prev, self.obs)
+        drying_factor = self.__get_monthly(self._drying_factor_cache, \
+            DroughtCode.get_drying_factor)
+        dc = DroughtCode(self.inputs, self.dc_prev, self.obs, \
+            self.equatorial, drying_factor)
         self.dc = dc.compute()
     
     def calculate_initial_spread_index(self):
-        isi = InitialSpreadIndex(self.inputs.wind, self.ffmc)
+        isi = InitialSpreadIndex(self.inputs.wind, self._ensure('ffmc'))
         self.isi = isi.compute()
     
     def calculate_buildup_index(self):
-        bui = BuildupIndex(self.dmc, self.dc)
+        bui = BuildupIndex(self._ensure('dmc'), self._ensure('dc'))
         self.bui = bui.compute()
     
     def calculate_fire_weather_index(self):
-        fwi = FireWeatherIndex(self.isi, self.bui)
+        fwi = FireWeatherIndex(self._ensure('isi'), self._ensure('bui'))
         self.fwi = fwi.compute()
     
     def compute(self):
@@ -585,14 +711,218 @@ class FWICalculator:
         fwi : ee.Image
             observed date's fire weather index
         """
-        self.calculate_fine_fuel_moisture_code()
-        self.calculate_duff_moisture_code()
-        self.calculate_drought_code()
-        self.calculate_initial_spread_index()
-        self.calculate_buildup_index()
-        self.calculate_fire_weather_index()
+        for name in self._CALCULATORS:
+            self._ensure(name)
         return self.fwi
+
+    def map_over_collection(self, daily_inputs):
+        """
+        Calculates the Fire Weather Indices for every image of a daily
+        collection server-side, carrying the moisture codes from one day
+        to the next with ee.ImageCollection.iterate, starting from the
+        previous codes set on this calculator
+
+        Parameters
+        ----------
+        daily_inputs : ee.ImageCollection
+            daily weather inputs at noon with T, H, W and R bands as
+            returned by get_fwi_weather_data_input, sorted by
+            system:time_start
+
+        Returns
+        -------
+        codes : ee.ImageCollection
+            daily images with all six Fire Weather Indices
+        """
+        equatorial = self.equatorial
+
+        def calculate_day(image, codes):
+            image = ee.Image(image)
+            codes = ee.List(codes)
+            prev = ee.Image(codes.get(-1))
+
+            calculator = FWICalculator( \
+                ee.Date(image.get('system:time_start')), \
+                _ImageInputs(image), equatorial)
+            calculator.set_previous_codes( \
+                prev.select('fine_fuel_moisture_code'), \
+                prev.select('duff_moisture_code'), \
+                prev.select('drought_code'))
+            calculator.compute()
+
+            return codes.add(calculator.get_fwi_codes().set( \
+                'system:time_start', image.get('system:time_start')))
+
+        initial = ee.Image([
+            self.ffmc_prev.rename('fine_fuel_moisture_code'),
+            self.dmc_prev.rename('duff_moisture_code'),
+            self.dc_prev.rename('drought_code')])
+        codes = ee.List(daily_inputs.iterate(calculate_day, \
+            ee.List([initial])))
+        return ee.ImageCollection.fromImages(codes.slice(1))
+
+    def compute_series(self, dates):
+        """
+        Calculates the Fire Weather Indices of consecutive days as one
+        server-side job with map_over_collection, starting from the
+        previous codes set on this calculator. The inputs of every date
+        come from the data source, timezone and bounds of this
+        calculator's inputs
+
+        Parameters
+        ----------
+        dates : list of datetime.date
+            the dates for observation, in order
+
+        Returns
+        -------
+        codes : ee.ImageCollection
+            daily images with all six Fire Weather Indices
+        """
+        return self.map_over_collection(self.inputs.__class__.batch( \
+            dates, self.inputs.timezone, self.inputs.bounds))
+
+    def get_fwi_codes(self):
+        """
+        Return a single ee.Image with all six Fire Weather Indices
+        """
+        return ee.Image([self._ensure(name) for name in self._CALCULATORS])
+
+    def export_codes(self, bucket, scale, crs = 'EPSG:4326'):
+        """
+        Exports all six Fire Weather Indices as a single multi-band
+        float32 GeoTIFF to Google Cloud Storage, so the shared
+        computation graph is evaluated by one export task
+
+        Parameters
+        ----------
+        bucket : str
+            the Google Cloud Storage bucket name
+        scale : int
+            the scale in meters
+        crs : str
+            EPSG code in string e.g. 'EPSG:4326'
+
+        Returns
+        -------
+        task : ee.batch.Task
+            the started export task
+        """
+        date_string = self.obs.strftime('%Y_%m_%d')
+        return self.__export_codes(bucket, scale, crs, \
+            self.inputs.bounds, date_string)
+
+    def export_codes_tiled(self, grid, bucket, scale, crs = 'EPSG:4326'):
+        """
+        Exports all six Fire Weather Indices with one export task per
+        tile of a grid, so large areas run as concurrent tasks each
+        within the pixel limit. The codes have no spatial dependency,
+        so the tiles need no overlap
+
+        Parameters
+        ----------
+        grid : ee.FeatureCollection
+            the tiles covering the inputs bounds, e.g. from
+            ee.Geometry.coveringGrid
+        bucket : str
+            the Google Cloud Storage bucket name
+        scale : int
+            the scale in meters
+        crs : str
+            EPSG code in string e.g. 'EPSG:4326'
+
+        Returns
+        -------
+        tasks : list of ee.batch.Task
+            the started export tasks, in tile order
+        """
+        date_string = self.obs.strftime('%Y_%m_%d')
+        size = grid.size().getInfo()
+        tiles = grid.toList(size)
+
+        tasks = []
+        for index in range(size):
+            region = ee.Feature(tiles.get(index)).geometry()
+            tasks.append(self.__export_codes(bucket, scale, crs, region, \
+                f'{date_string}_{index}'))
+        return tasks
+
+    def __export_codes(self, bucket, scale, crs, region, name):
+        """
+        Starts the export task of the six codes over a region
+        """
+        task = ee.batch.Export.image.toCloudStorage(
+            image = self.get_fwi_codes().toFloat(),
+            description = f'FWI_stack_{name}',
+            bucket = bucket,
+            fileNamePrefix = f'FWI_{name}',
+            region = region,
+            scale = scale,
+            crs = crs,
+            maxPixels = 1e13)
+        task.start()
+        return task
     
+    def checkpoint_codes(self, asset_id, scale, crs = 'EPSG:4326'):
+        """
+        Exports today's FFMC, DMC and DC to an Earth Engine asset, so a
+        long daily loop can restart from stored codes instead of
+        chaining every previous day's graph into the next one
+
+        Parameters
+        ----------
+        asset_id : str
+            the asset to write, e.g. 'users/name/fwi_codes_2021_08_01'
+        scale : int
+            the scale in meters
+        crs : str
+            EPSG code in string e.g. 'EPSG:4326'
+
+        Returns
+        -------
+        task : ee.batch.Task
+            the started export task
+        """
+        codes = ee.Image([self._ensure('ffmc'), self._ensure('dmc'), \
+            self._ensure('dc')]).toFloat()
+        task = ee.batch.Export.image.toAsset(
+            image = codes,
+            description = asset_id.split('/')[-1],
+            assetId = asset_id,
+            region = self.inputs.bounds,
+            scale = scale,
+            crs = crs,
+            maxPixels = 1e13)
+        task.start()
+        return task
+
+    def restore_previous_codes(self, asset_id, inputs=None):
+        """
+        Sets the previous codes from an asset written by
+        checkpoint_codes, once its export task has completed. The
+        checkpoint holds the codes of the day it was written for, so
+        they become the previous codes of the following day: given
+        that day's inputs, the calculator moves to it as update_inputs
+        does, otherwise it must already hold the following day's
+        observation date and inputs. Calling update_inputs after the
+        restore would apply the checkpointed day's weather twice
+
+        Parameters
+        ----------
+        asset_id : str
+            the asset written by checkpoint_codes
+        inputs : FWIInputs
+            daily observed weather inputs at noon of the day after
+            the checkpoint
+        """
+        codes = ee.Image(asset_id)
+        self.set_previous_codes(codes.select('fine_fuel_moisture_code'), \
+            codes.select('duff_moisture_code'), codes.select('drought_code'))
+
+        if inputs is not None:
+            self.obs = self.obs + datetime.timedelta(days=1)
+            self.inputs = inputs
+
     def update_inputs(self, inputs):
         """
         Updates the daily inputs required to calculate next day's
@@ -603,9 +933,43 @@ class FWICalculator:
         inputs : FWIInputs
             next daily observed weather inputs at noon
         """
+        self.ffmc_prev = self._ensure('ffmc')
+        self.dmc_prev = self._ensure('dmc')
+        self.dc_prev = self._ensure('dc')
+        self.__reset_codes()
+
         self.obs = self.obs + datetime.timedelta(days=1)
         self.inputs = inputs
 
-        self.ffmc_prev = self.ffmc
-        self.dmc_prev = self.dmc
-        self.dc_prev = self.dc
+def make_calculator(obs, inputs, equatorial=True, backend='ee', **kwargs):
+    """
+    Returns the FWI calculator of a backend
+
+    Parameters
+    ----------
+    obs : datetime.datetime
+        the observation datetime
+    inputs : FWIInputs
+        daily observed weather inputs at noon, as ee.Image for the
+        'ee' backend or as numpy arrays for the 'numpy' backend
+    equatorial : bool
+        use equatorial mode to calculate day length and
+        drying factor
+    backend : str
+        'ee' for an FWICalculator, or 'numpy' for an FWICalculatorNumpy
+        that calculates without Earth Engine
+    kwargs : dict
+        other arguments of the backend's calculator, e.g. latitude for
+        the 'numpy' backend
+
+    Returns
+    -------
+    calculator : FWICalculator or FWICalculatorNumpy
+        the calculator of the backend
+    """
+    if backend == 'ee':
+        return FWICalculator(obs, inputs, equatorial, **kwargs)
+    if backend == 'numpy':
+        from .FWINumpy import FWICalculatorNumpy
+        return FWICalculatorNumpy(obs, inputs, equatorial, **kwargs)
+    raise ValueError(f'unknown backend {backend!r}')
@@ -1,20 +1,58 @@
 import ee
 import eemont
-import math
+import functools
+import os
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
 import dateutil
 
-class FWI_GFS_GSMAP:
+# Collection handles shared by every instance, created on first use
+# because ee.ImageCollection needs an initialized client
+_collections = {}
+
+def _get_collection(collection_id):
     """
-    NOAA/NASA Global Forecast System (384-Hour Predicted Atmosphere Data)
-    from Google Earth Engine for Canadian Fire Weather Index System calculation
+    Returns the cached ee.ImageCollection for a collection id
+    """
+    if collection_id not in _collections:
+        _collections[collection_id] = ee.ImageCollection(collection_id)
+    return _collections[collection_id]
+
+def _era5_image(utc_datetime):
+    """
+    Returns the ERA5-Land hourly ee.Image of a UTC datetime's hour
+    """
+    image_id = utc_datetime.strftime('%Y%m%dT%H')
+    return ee.Image(f'ECMWF/ERA5_LAND/HOURLY/{image_id}')
+
+@functools.lru_cache(maxsize = 256)
+def _cached_inputs(source, date, timezone, bounds_json):
+    """
+    Returns the clipped T, H, W and R ee.Image of an input class, built
+    once per date, timezone and serialized boundary so reruns of the
+    same day and region reuse the same computation graph
+    """
+    bounds = ee.deserializer.fromJSON(bounds_json)
+    return source(date, timezone, bounds, cache = False).image
+
+class FWIInputs:
+    """
+    Daily weather inputs at local noon for the Canadian Fire Weather
+    Index System, shared by every data source. Subclasses implement
+    _get_fwi_inputs to set temp, rhum, wind and rain from their
+    datasets and then call _fuse_inputs
 
     Attributes
     ----------
-    date_time : datetime
-        the datetime in noon local time for the observation
+    date : datetime.date
+        the date for observation
+    timezone : dateutil.tz
+        timezone
     bounds : ee.Geometry
         the boundary used to limit the ee.Image file
+    image : ee.Image
+        the T, H, W and R inputs as one image clipped to bounds
     temp : ee.Image
         temperature in degree Celsius observed in noon
     rhum : ee.Image
@@ -25,7 +63,10 @@ class FWI_GFS_GSMAP:
         total precipitation in mm in the past 24 hours, observed in noon
     """
 
-    def __init__(self, date, timezone, bounds):
+    # File name prefix of the exported inputs
+    _EXPORT_PREFIX = 'inputs'
+
+    def __init__(self, date, timezone, bounds, cache = True):
         """
         Constructs all the necessary attributes to get the raster data
         observed at a certain date inside a boundary
@@ -38,74 +79,105 @@ class FWI_GFS_GSMAP:
             timezone
         bounds : ee.Geometry
             the boundary used to limit the ee.Image file
+        cache : bool
+            reuse the inputs already built for this date, timezone
+            and boundary
         """
         self.date = date
         self.bounds = bounds
         self.timezone = timezone
 
-        self.__get_fwi_inputs()
+        if cache:
+            self._set_image(_cached_inputs(type(self), date, timezone, \
+                bounds.serialize()))
+        else:
+            self._get_fwi_inputs()
 
-    def __calculate_temperature(self):
+    def _get_fwi_inputs(self):
         """
-        Calculates the GFS temperature
+        Calculate all the inputs required for FWI Calculation
         """
-        temp_band = 'temperature_2m_above_ground'
-        self.temp = self.gfs.select(temp_band) \
-            .rename('T')
+        raise NotImplementedError
 
-    def __calculate_relative_humidity(self):
+    def _get_noon_utc(self):
         """
-        Calculates the GFS relative humidity
+        Returns the local standard noon of the observed date in UTC
         """
-        rhum_band = 'relative_humidity_2m_above_ground'
-        self.rhum = self.gfs.select(rhum_band) \
-            .rename('H')
+        local_noon = datetime(self.date.year, self.date.month, \
+            self.date.day, hour = 12, tzinfo = dateutil.tz.gettz( \
+            self.timezone))
+        return local_noon.astimezone(dateutil.tz.UTC)
 
-    def __calculate_wind(self):
+    def _calculate_wind(self, image, u_comp_band, v_comp_band):
         """
         Adds two vectors to find the wind speed scalar magnitude
         and convert from m/s to kph
         """
-        u_comp_band = 'u_component_of_wind_10m_above_ground'
-        v_comp_band = 'v_component_of_wind_10m_above_ground'
-        u_comp = self.gfs.select(u_comp_band)
-        v_comp = self.gfs.select(v_comp_band)
+        u_comp = image.select(u_comp_band)
+        v_comp = image.select(v_comp_band)
 
-        wind = ((u_comp ** 2 + v_comp ** 2) ** 0.5) * 3.6
+        wind = u_comp.hypot(v_comp) * 3.6
         self.wind = wind.rename('W')
 
-    def __calculate_rain(self):
+    def _fuse_inputs(self):
         """
-        Use JAXA GSMaP to get past 24 hours rain in mm
+        Fuses the four inputs into one image, clipped once
         """
-        self.rain = self.gsmap.reduce(ee.Reducer.sum()) \
-                        .rename('R')
+        self._set_image(ee.Image([self.temp, self.rhum, self.wind, \
+            self.rain]).clip(self.bounds))
 
-    def __get_fwi_inputs(self):
+    def _set_image(self, image):
         """
-        Calculate all the inputs required for FWI Calculation
+        Sets the fused input image and its T, H, W and R bands
         """
-        # Create noon local standard datetime
-        local_noon = datetime(self.date.year, self.date.month, \
-            self.date.day, hour = 12, tzinfo = dateutil.tz.gettz( \
-            self.timezone))
-        utc_datetime = local_noon.astimezone(dateutil.tz.UTC)
-        forecast_time = int(utc_datetime.timestamp() * 1000)
+        self.image = image
+        self.temp = image.select('T')
+        self.rhum = image.select('H')
+        self.wind = image.select('W')
+        self.rain = image.select('R')
 
-        start_datetime = utc_datetime - timedelta(days = 1)
+    @classmethod
+    def batch(cls, dates, timezone, bounds):
+        """
+        Builds the inputs of several dates as one collection, e.g. for
+        FWICalculator.map_over_collection
 
-        self.gfs = ee.ImageCollection(f'NOAA/GFS0P25') \
-            .filterMetadata('forecast_time', 'equals', forecast_time) \
-            .closest(start_datetime.isoformat()).first()
+        Parameters
+        ----------
+        dates : list of datetime.date
+            the dates for observation, in order
+        timezone : dateutil.tz
+            timezone
+        bounds : ee.Geometry
+            the boundary used to limit the ee.Image file
 
-        self.gsmap = ee.ImageCollection('JAXA/GPM_L3/GSMaP/v6/operational') \
-            .filterDate(start_datetime.isoformat(), utc_datetime.isoformat()) \
-            .select('hourlyPrecipRateGC')
+        Returns
+        -------
+        inputs : ee.ImageCollection
+            daily T, H, W and R images with system:time_start set to
+            the observed date
+        """
+        return ee.ImageCollection.fromImages([
+            cls(date, timezone, bounds).image.set( \
+                'system:time_start', ee.Date(date.isoformat()).millis())
+            for date in dates])
 
-        self.__calculate_temperature()
-        self.__calculate_relative_humidity()
-        self.__calculate_wind()
-        self.__calculate_rain()
+    def update_fwi_inputs(self, date):
+        """
+        Moves the inputs to another observed date, reusing the cached
+        inputs of that date and leaving them untouched when the date is
+        unchanged. Inputs of a new date are not preprocessed
+
+        Parameters
+        ----------
+        date : datetime.date
+            the date for the observation
+        """
+        if date == self.date:
+            return
+        self.date = date
+        self._set_image(_cached_inputs(type(self), date, self.timezone, \
+            self.bounds.serialize()))
 
     def preprocess(self, interpolation, crs, scale):
         """
@@ -113,41 +185,115 @@ class FWI_GFS_GSMAP:
 
         Parameters
         ----------
+        crs: string
+            EPSG code in string e.g. 'EPSG:4326'
         scale: int
             the scale in meters
         Returns
         -------
         None
         """
-        self.temp = self.temp.resample(interpolation) \
-            .reproject(crs = crs, scale = scale)
-
-        self.rhum = self.rhum.resample(interpolation) \
-            .reproject(crs = crs, scale = scale)
-
-        self.wind = self.wind.resample(interpolation) \
-            .reproject(crs = crs, scale = scale)
-
-        self.rain = self.rain.resample(interpolation) \
-            .reproject(crs = crs, scale = scale)
+        # Reproject the four inputs together so the FWI calculation
+        # inherits a single projection
+        self._set_image(self.image.resample(interpolation) \
+            .reproject(crs = crs, scale = scale))
 
     def get_fwi_weather_data_input(self):
         """
         Return a single ee.Image for FWI weather data input
         """
-        return ee.Image([self.temp, self.rhum, self.wind, self.rain])
+        return self.image
+
+    def export_fwi_weather_data_input(self, bucket, scale, crs = 'EPSG:4326'):
+        """
+        Exports the four FWI weather data inputs as a single multi-band
+        float32 GeoTIFF to Google Cloud Storage with one export task
+
+        Parameters
+        ----------
+        bucket : str
+            the Google Cloud Storage bucket name
+        scale : int
+            the scale in meters
+        crs : str
+            EPSG code in string e.g. 'EPSG:4326'
 
-class FWI_ERA5:
+        Returns
+        -------
+        task : ee.batch.Task
+            the started export task
+        """
+        date_string = self.date.strftime('%Y_%m_%d')
+        task = ee.batch.Export.image.toCloudStorage(
+            image = self.get_fwi_weather_data_input().toFloat(),
+            description = f'{self._EXPORT_PREFIX}_{date_string}',
+            bucket = bucket,
+            fileNamePrefix = f'{self._EXPORT_PREFIX}_{date_string}',
+            region = self.bounds,
+            scale = scale,
+            crs = crs,
+            maxPixels = 1e13)
+        task.start()
+        return task
+
+    def download(self, scale, out_dir, crs = 'EPSG:4326', executor = None, \
+            workers = 4):
+        """
+        Downloads the four FWI weather data inputs as float32 GeoTIFFs,
+        one request per band so each stays under the download size
+        limit, with the requests made concurrently
+
+        Parameters
+        ----------
+        scale : int
+            the scale in meters
+        out_dir : str
+            the directory to write the GeoTIFFs to
+        crs : str
+            EPSG code in string e.g. 'EPSG:4326'
+        executor : concurrent.futures.Executor
+            the executor running the downloads, a thread pool of
+            workers threads when None
+        workers : int
+            the number of threads when no executor is given
+
+        Returns
+        -------
+        paths : list of str
+            the GeoTIFF paths in T, H, W and R order
+        """
+        date_string = self.date.strftime('%Y_%m_%d')
+
+        def fetch(band):
+            url = self.image.select(band).toFloat().getDownloadURL({
+                'scale': scale,
+                'crs': crs,
+                'region': self.bounds,
+                'format': 'GEO_TIFF'})
+            path = os.path.join(out_dir, \
+                f'{self._EXPORT_PREFIX}_{band}_{date_string}.tif')
+            urllib.request.urlretrieve(url, path)
+            return path
+
+        bands = ['T', 'H', 'W', 'R']
+        if executor is None:
+            with ThreadPoolExecutor(max_workers = workers) as executor:
+                return list(executor.map(fetch, bands))
+        return list(executor.map(fetch, bands))
+
+class FWI_GFS_GSMAP(FWIInputs):
     """
-    ECMWF ERA5 Reanalysis Hourly Dataset from Google Earth Engine
-    for Canadian Fire Weather Index System calculation
+    NOAA/NASA Global Forecast System (384-Hour Predicted Atmosphere Data)
+    from Google Earth Engine for Canadian Fire Weather Index System calculation
 
     Attributes
     ----------
-    date_time : datetime
-        the datetime in noon local time for the observation
+    date : datetime.date
+        the date for observation
     bounds : ee.Geometry
         the boundary used to limit the ee.Image file
+    image : ee.Image
+        the T, H, W and R inputs as one image clipped to bounds
     temp : ee.Image
         temperature in degree Celsius observed in noon
     rhum : ee.Image
@@ -158,22 +304,82 @@ class FWI_ERA5:
         total precipitation in mm in the past 24 hours, observed in noon
     """
 
-    def __init__(self, date, timezone, bounds):
+    _EXPORT_PREFIX = 'GFS_GSMAP_inputs'
+
+    def __calculate_weather(self):
         """
-        Constructs all the necessary attributes to get the raster data
-        observed at a certain datetime inside a boundary
+        Reads the GFS temperature, relative humidity and wind in one
+        band selection, the wind speed from its two vectors in kph
+        """
+        gfs = self.gfs.select([
+            'temperature_2m_above_ground',
+            'relative_humidity_2m_above_ground',
+            'u_component_of_wind_10m_above_ground',
+            'v_component_of_wind_10m_above_ground'], ['T', 'H', 'u', 'v'])
 
-        Attributes
-        ----------
-        date : datetime.date
-            the date for the observation
-        bounds : ee.Geometry
-            the boundary used to limit the ee.Image file
+        self.temp = gfs.select('T')
+        self.rhum = gfs.select('H')
+        self._calculate_wind(gfs, 'u', 'v')
+
+    def __calculate_rain(self):
         """
-        self.date = date
-        self.bounds = bounds
-        self.timezone = timezone
-        self.__get_fwi_inputs()
+        Use JAXA GSMaP to get past 24 hours rain in mm
+        """
+        # Spread the hourly reduction over more workers so large
+        # bounds stay within the memory limit
+        self.rain = self.gsmap.reduce(ee.Reducer.sum(), \
+            parallelScale = 4).rename('R')
+
+    def _get_fwi_inputs(self):
+        """
+        Calculate all the inputs required for FWI Calculation
+        """
+        utc_datetime = self._get_noon_utc()
+        forecast_time = int(utc_datetime.timestamp() * 1000)
+
+        start_datetime = utc_datetime - timedelta(days = 1)
+
+        # The forecast initialization and the rain window share the
+        # same start, format it once
+        start_iso = start_datetime.isoformat()
+        end_iso = utc_datetime.isoformat()
+
+        self.gfs = _get_collection('NOAA/GFS0P25') \
+            .filterMetadata('forecast_time', 'equals', forecast_time) \
+            .closest(start_iso).first()
+
+        self.gsmap = _get_collection('JAXA/GPM_L3/GSMaP/v6/operational') \
+            .filterDate(start_iso, end_iso) \
+            .select('hourlyPrecipRateGC')
+
+        self.__calculate_weather()
+        self.__calculate_rain()
+        self._fuse_inputs()
+
+class FWI_ERA5(FWIInputs):
+    """
+    ECMWF ERA5 Reanalysis Hourly Dataset from Google Earth Engine
+    for Canadian Fire Weather Index System calculation
+
+    Attributes
+    ----------
+    date : datetime.date
+        the date for observation
+    bounds : ee.Geometry
+        the boundary used to limit the ee.Image file
+    image : ee.Image
+        the T, H, W and R inputs as one image clipped to bounds
+    temp : ee.Image
+        temperature in degree Celsius observed in noon
+    rhum : ee.Image
+        relative humidity in percent observed in noon
+    wind : ee.Image
+        wind speed in kph observed in noon
+    rain : ee.Image
+        total precipitation in mm in the past 24 hours, observed in noon
+    """
+
+    _EXPORT_PREFIX = 'ERA5_inputs'
 
     def __calculate_temperature(self):
         """
@@ -185,95 +391,52 @@ class FWI_ERA5:
     def __calculate_relative_humidity(self):
         """
         Calculates the Relative Humidity from Dewpoint and temperature
-        in Celsius
-        """
-        try:
-            temp = self.temp
-        except AttributeError:
-            self.__calculate_temperature()
-            temp = self.temp
-
-        dew = self.era5.select('dewpoint_temperature_2m') - 273.15
-
-        rhum = 100 * (math.exp(1) ** ((17.625 * dew) / (243.04 + dew)) / \
-                    math.exp(1) ** ((17.625 * temp) / (243.04 + temp)))
+        in Kelvin
+        """
+        # Magnus formula as one expression node on the Kelvin bands,
+        # 243.04 + (x - 273.15) folded into x - 30.11 and the ratio of
+        # exponentials taken as the exponential of the difference
+        rhum = self.era5.expression(
+            '100.0 * exp(17.625 * ((d - 273.15) / (d - 30.11) - ' \
+            '(t - 273.15) / (t - 30.11)))', {
+                'd': self.era5.select('dewpoint_temperature_2m'),
+                't': self.era5.select('temperature_2m')})
         self.rhum = rhum.rename('H')
 
     def __calculate_rain(self):
         """
-        Adds total_precipitation from past 24 hours and convert from m to mm
+        Finds the total_precipitation of the past 24 hours from the
+        accumulated values and convert from m to mm
         """
-        rain_24h = self.era5_rain.select('total_precipitation') \
-                        .reduce(ee.Reducer.sum())
-
-        self.rain = (rain_24h * 1000.0).rename('R')
+        self.rain = (self.era5_rain * 1000.0).rename('R')
 
-    def __calculate_wind(self):
-        """
-        Adds two vectors to find the wind speed scalar magnitude
-        and convert from m/s to kph
-        """
-        u_comp = self.era5.select('u_component_of_wind_10m')
-        v_comp = self.era5.select('v_component_of_wind_10m')
-
-        wind = ((u_comp ** 2 + v_comp ** 2) ** 0.5) * 3.6
-        self.wind = wind.rename('W')
-
-    def __get_fwi_inputs(self):
+    def _get_fwi_inputs(self):
         """
         Calculate all the inputs required for FWI Calculation
         """
-        # Create noon local standard datetime
-        local_noon = datetime(self.date.year, self.date.month, \
-            self.date.day, hour = 12, tzinfo = dateutil.tz.gettz( \
-            self.timezone))
-        utc_datetime = local_noon.astimezone(dateutil.tz.UTC)
+        utc_datetime = self._get_noon_utc()
         start_datetime = utc_datetime - timedelta(days = 1)
 
-        image_id = f'{utc_datetime.year}' + \
-                    f'{str(utc_datetime.month).zfill(2)}' + \
-                    f'{str(utc_datetime.day).zfill(2)}T' + \
-                    f'{str(utc_datetime.hour).zfill(2)}'
-
-        self.era5_rain = ee.ImageCollection('ECMWF/ERA5_LAND/HOURLY') \
-            .filterDate(start_datetime.isoformat(), \
-                utc_datetime.isoformat())
-
-        self.era5 = ee.Image(f'ECMWF/ERA5_LAND/HOURLY/{image_id}')
+        self.era5 = _era5_image(utc_datetime)
+
+        # total_precipitation accumulates from 00 UTC and the 00 UTC
+        # image holds the whole previous day, so the past 24 hours are
+        # today's accumulation plus what fell after this hour yesterday
+        total_precipitation = self.era5.select('total_precipitation')
+        if utc_datetime.hour == 0:
+            self.era5_rain = total_precipitation
+        else:
+            self.era5_rain = total_precipitation.expression(
+                'max(tp + tp_00 - tp_prev, 0.0)', {
+                    'tp': total_precipitation,
+                    'tp_00': _era5_image(utc_datetime.replace(hour = 0)) \
+                        .select('total_precipitation'),
+                    'tp_prev': _era5_image(start_datetime) \
+                        .select('total_precipitation')})
 
         self.__calculate_temperature()
         self.__calculate_relative_humidity()
-        self.__calculate_wind()
+        self._calculate_wind(self.era5, 'u_component_of_wind_10m', \
+            'v_component_of_wind_10m')
         self.__calculate_rain()
-
-    def preprocess(self, interpolation, crs, scale):
-        """
-        Resample the rasters to a scale
-
-        Parameters
-        ----------
-        crs: string
-            EPSG code in string e.g. 'EPSG:4326'
-        scale: int
-            the scale in meters
-        Returns
-        -------
-        None
-        """
-        self.temp = self.temp.resample(interpolation) \
-            .reproject(crs = crs, scale = scale)
-
-        self.rhum = self.rhum.resample(interpolation) \
-            .reproject(crs = crs, scale = scale)
-
-        self.wind = self.wind.resample(interpolation) \
-            .reproject(crs = crs, scale = scale)
-
-        self.rain = self.rain.resample(interpolation) \
-            .reproject(crs = crs, scale = scale)
-
-    def get_fwi_weather_data_input(self):
-        """
-        Return a single ee.Image for FWI weather data input
-        """
-        return ee.Image([self.temp, self.rhum, self.wind, self.rain])
+        self._fuse_inputs()
@@ -0,0 +1,484 @@
+import math
+import datetime
+import numpy as np
+from numba import guvectorize
+
+# The kernels below transcribe the scalar Van Wagner (1987) equations
+# used by the ee.Image expressions in FWI.py, one call per pixel, so
+# codes can be calculated and validated without Earth Engine. They
+# are generalized ufuncs with scalar core layouts, so the parallel
+# target threads over every element of a grid, a flattened vector of
+# stations or a stack of days alike, and broadcasts scalar arguments.
+# math.exp, math.log and math.pow inside the kernels compile to LLVM
+# intrinsics; installing icc_rt lets Numba use Intel SVML for the
+# vectorized versions
+
+# Natural log of 10, used to express 10 ** x as exp(x * ln 10)
+_LN_10 = math.log(10.0)
+
+# Monthly day length approximations by latitude band
+_DAY_LENGTH_46N = np.array([ 6.5,  7.5,  9.0, 12.8, 13.9, 13.9, \
+                            12.4, 10.9,  9.4,  8.0,  7.0,  6.0])
+_DAY_LENGTH_20N = np.array([ 7.9,  8.4,  8.9,  9.5,  9.9, 10.2, \
+                            10.1,  9.7,  9.1,  8.6,  8.1,  7.8])
+_DAY_LENGTH_20S = np.array([10.1,  9.6,  9.1,  8.5,  8.1,  7.8, \
+                             7.9,  8.3,  8.9,  9.4,  9.9, 10.2])
+_DAY_LENGTH_40S = np.array([11.5, 10.5,  9.2,  7.9,  6.8,  6.2, \
+                             6.5,  7.4,  8.7, 10.0, 11.2, 11.8])
+
+# Monthly day length adjustment factors by hemisphere
+_DRYING_FACTOR_N = np.array([-1.6, -1.6, -1.6, 0.9, 3.8, 5.8, \
+                              6.4,  5.0,  2.4, 0.4, -1.6, -1.6])
+_DRYING_FACTOR_S = np.array([ 6.4,  5.0,  2.4, 0.4, -1.6, -1.6, \
+                             -1.6, -1.6, -1.6, 0.9,  3.8,  5.8])
+
+def _gufunc(arity):
+    """
+    Compiles a float32 kernel with arity scalar inputs and one scalar
+    output, on the parallel target or, when no threading layer is
+    available, on the single-threaded cpu target
+    """
+    signature = 'void(' + ', '.join(['f4'] * arity) + ', f4[:])'
+    layout = ','.join(['()'] * arity) + '->()'
+
+    def decorate(kernel):
+        try:
+            return guvectorize([signature], layout, nopython = True, \
+                fastmath = True, target = 'parallel')(kernel)
+        except Exception:
+            return guvectorize([signature], layout, nopython = True, \
+                fastmath = True, cache = True, target = 'cpu')(kernel)
+    return decorate
+
+@_gufunc(5)
+def ffmc_kernel(T, H, W, R, ffmc_prev, out):
+    """
+    Fine Fuel Moisture Code of a pixel, written to out
+    """
+    # Convert FFMC to moisture content
+    mo = 147.2 * (101.0 - ffmc_prev) / (59.5 + ffmc_prev)
+
+    # Moisture content after rain, corrected above 150
+    if R > 0.5:
+        r_f = R - 0.5
+        m_r = mo + 42.5 * r_f * math.exp(-100.0 / (251.0 - mo)) * \
+            (1.0 - math.exp(-6.93 / r_f))
+        if mo > 150.0:
+            m_r += 0.0015 * (mo - 150.0) * (mo - 150.0) * math.sqrt(r_f)
+        mo = min(m_r, 250.0)
+
+    rh_frac = H / 100.0
+    rh_exp = math.exp((H - 100.0) / 10.0)
+    temp_term = 0.18 * (21.1 - T) * (1.0 - math.exp(-0.115 * H))
+    temp_factor = 0.581 * math.exp(0.0365 * T)
+    wind_sqrt = math.sqrt(W)
+
+    # Drying above the drying equilibrium, wetting below the wetting
+    # equilibrium and no change in between
+    E_d = 0.942 * math.pow(H, 0.679) + 11.0 * rh_exp + temp_term
+    if mo > E_d:
+        k_d = (0.424 * (1.0 - math.pow(rh_frac, 1.7)) + 0.0694 * \
+            wind_sqrt * (1.0 - rh_frac ** 8)) * temp_factor
+        m = E_d + (mo - E_d) * math.exp(-_LN_10 * k_d)
+    else:
+        E_w = 0.618 * math.pow(H, 0.753) + 10.0 * rh_exp + temp_term
+        if mo < E_w:
+            rh_deficit = 1.0 - rh_frac
+            k_w = (0.424 * (1.0 - math.pow(rh_deficit, 1.7)) + 0.0694 * \
+                wind_sqrt * (1.0 - rh_deficit ** 8)) * temp_factor
+            m = E_w - (E_w - mo) * math.exp(-_LN_10 * k_w)
+        else:
+            m = mo
+
+    out[0] = min(59.5 * (250.0 - m) / (147.2 + m), 101.0)
+
+@_gufunc(5)
+def dmc_kernel(T, H, R, dmc_prev, day_length, out):
+    """
+    Duff Moisture Code of a pixel, written to out
+    """
+    P = dmc_prev
+
+    # DMC after rain, yesterday's DMC on negligible rain
+    if R > 1.5:
+        r_e = 0.92 * R - 1.27
+        M_o = 20.0 + 280.0 / math.exp(0.023 * P)
+        if P <= 33.0:
+            b = 100.0 / (0.5 + 0.3 * P)
+        elif P <= 65.0:
+            b = 14.0 - 1.3 * math.log(P)
+        else:
+            b = 6.2 * math.log(P) - 17.2
+        M_r = M_o + 1000.0 * r_e / (48.77 + b * r_e)
+        P = max(244.72 - 43.43 * math.log(M_r - 20.0), 0.0)
+
+    # Log drying rate, no drying at or below -1.1 degree Celsius
+    out[0] = P + 1.894 * max(T + 1.1, 0.0) * (100.0 - H) * \
+        day_length / 10000.0
+
+@_gufunc(4)
+def dc_kernel(T, R, dc_prev, drying_factor, out):
+    """
+    Drought Code of a pixel, written to out
+    """
+    D = dc_prev
+
+    # DC after rain, yesterday's DC on negligible rain
+    if R > 2.8:
+        Q_o = 800.0 * math.exp(-D / 400.0)
+        Q_r = Q_o + 3.937 * (0.83 * R - 1.27)
+        D = max(400.0 * math.log(800.0 / Q_r), 0.0)
+
+    # No temperature term at or below -2.8 degree Celsius and no
+    # negative evapotranspiration
+    out[0] = D + 0.5 * max(0.36 * max(T + 2.8, 0.0) + drying_factor, 0.0)
+
+@_gufunc(2)
+def isi_kernel(W, ffmc, out):
+    """
+    Initial Spread Index of a pixel, written to out
+    """
+    m = 147.2 * (101.0 - ffmc) / (59.5 + ffmc)
+    out[0] = 0.208 * math.exp(0.05039 * W) * 91.9 * \
+        math.exp(-0.1386 * m) * (1.0 + math.pow(m, 5.31) / 49300000.0)
+
+@_gufunc(2)
+def bui_kernel(dmc, dc, out):
+    """
+    Buildup Index of a pixel, written to out
+    """
+    P = dmc
+    D = dc
+
+    # Zero when both codes are zero and never negative, as in
+    # Van Wagner and Pickett (1985)
+    if P + 0.4 * D == 0.0:
+        out[0] = 0.0
+    elif P <= 0.4 * D:
+        out[0] = 0.8 * P * D / (P + 0.4 * D)
+    else:
+        out[0] = max(P - (1.0 - 0.8 * D / (P + 0.4 * D)) * \
+            (0.92 + math.pow(0.0114 * P, 1.7)), 0.0)
+
+@_gufunc(2)
+def fwi_kernel(isi, bui, out):
+    """
+    Fire Weather Index of a pixel, written to out
+    """
+    # Duff moisture function, heat transfer form above 80
+    if bui > 80.0:
+        f_D = 1000.0 / (25.0 + 108.64 * math.exp(-0.023 * bui))
+    else:
+        f_D = 0.626 * math.pow(bui, 0.809) + 2.0
+    B = 0.1 * isi * f_D
+
+    if B > 1.0:
+        out[0] = math.exp(2.72 * math.pow(0.434 * math.log(B), 0.647))
+    else:
+        out[0] = B
+
+def _day_length_by_latitude(latitude, month):
+    """
+    Returns the day length of a zero-based month for a latitude array
+    """
+    return np.select([latitude > 33.0, latitude > 0.0, \
+        latitude > -30.0], [_DAY_LENGTH_46N[month], \
+        _DAY_LENGTH_20N[month], _DAY_LENGTH_20S[month]], \
+        _DAY_LENGTH_40S[month]).astype(np.float32)
+
+def _drying_factor_by_latitude(latitude, month):
+    """
+    Returns the drying factor of a zero-based month for a latitude array
+    """
+    return np.where(latitude > 0.0, \
+        _DRYING_FACTOR_N[month], _DRYING_FACTOR_S[month]) \
+        .astype(np.float32)
+
+def _broadcast(value, shape):
+    """
+    Returns value as a float32 array broadcast to shape
+    """
+    return np.broadcast_to(np.asarray(value, dtype = np.float32), shape)
+
+class FWICalculatorNumpy:
+    """
+    FWI Calculator based on the Canadian Fire Weather Index System
+    using NumPy arrays and Numba kernels, mirroring FWICalculator
+
+    Attributes
+    ----------
+    obs : datetime.date
+        the observation date
+    inputs : FWIInputs
+        daily observed weather inputs at noon, with temp, rhum, wind
+        and rain as numpy arrays of the same shape
+    latitude : numpy.ndarray
+        latitude of every pixel, required outside equatorial mode
+    ffmc : numpy.ndarray
+        today's fine fuel moisture code
+    dmc : numpy.ndarray
+        today's duff moisture code
+    dc : numpy.ndarray
+        today's drought code
+    isi : numpy.ndarray
+        today's initial spread index
+    bui : numpy.ndarray
+        today's buildup index
+    fwi : numpy.ndarray
+        today's fire weather index
+    """
+
+    # Fixed-point scale of get_fwi_codes_int16, a resolution of 0.1
+    # up to 3276.7, beyond any observed Drought Code
+    INT16_SCALE = 10.0
+
+    # Method calculating each code, in dependency order
+    _CALCULATORS = {
+        'ffmc': 'calculate_fine_fuel_moisture_code',
+        'dmc': 'calculate_duff_moisture_code',
+        'dc': 'calculate_drought_code',
+        'isi': 'calculate_initial_spread_index',
+        'bui': 'calculate_buildup_index',
+        'fwi': 'calculate_fire_weather_index',
+    }
+
+    def __init__(self, obs, inputs, equatorial=True, latitude=None):
+        """
+        Constructs all the necessary attributes for the
+        FWICalculatorNumpy object
+
+        Parameters
+        ----------
+        obs : datetime.date
+            the observation date
+        inputs : FWIInputs
+            daily observed weather inputs at noon as numpy arrays
+        equatorial : bool
+            use equatorial mode to calculate day length and
+            drying factor
+        latitude : numpy.ndarray
+            latitude of every pixel, broadcast to the input shape
+        """
+        self.obs = obs
+        self.inputs = inputs
+        self.equatorial = equatorial
+        self.latitude = latitude
+
+        self.set_previous_codes()
+
+    def __reset_codes(self):
+        """
+        Marks all of today's codes as not yet calculated
+        """
+        self.ffmc = self.dmc = self.dc = None
+        self.isi = self.bui = self.fwi = None
+
+    def _ensure(self, name):
+        """
+        Returns today's code by name, calculating it and its
+        prerequisites only if they have not been calculated yet
+        """
+        if getattr(self, name) is None:
+            getattr(self, self._CALCULATORS[name])()
+        return getattr(self, name)
+
+    def _shape(self):
+        return np.shape(self.inputs.temp)
+
+    def _run(self, kernel, *arrays):
+        """
+        Runs a kernel over the arrays as float32, broadcast to the
+        input shape
+        """
+        shape = self._shape()
+        return kernel(*[_broadcast(array, shape) for array in arrays])
+
+    def _monthly(self, equatorial_value, by_latitude):
+        """
+        Returns the per-pixel factor for the observed month from
+        by_latitude, or the constant in equatorial mode
+        """
+        if self.equatorial:
+            return equatorial_value
+        if self.latitude is None:
+            raise ValueError('latitude is required outside ' \
+                'equatorial mode')
+        return by_latitude(np.asarray(self.latitude), self.obs.month - 1)
+
+    def _day_length(self):
+        return self._monthly(9.0, _day_length_by_latitude)
+
+    def _drying_factor(self):
+        return self._monthly(1.39, _drying_factor_by_latitude)
+
+    def set_previous_codes(self, ffmc_prev=85.0, dmc_prev=6.0, dc_prev=15.0):
+        """
+        Sets the initial value for Fine Fuel Moisture Code,
+        Duff Moisture Code, and Drought Code
+
+        Parameters
+        ----------
+        ffmc_prev : float or numpy.ndarray
+            the initial value for FFMC
+        dmc_prev : float or numpy.ndarray
+            the initial value for DMC
+        dc_prev : float or numpy.ndarray
+            the initial value for DC
+
+        Returns
+        -------
+        None
+        """
+        self.ffmc_prev = ffmc_prev
+        self.dmc_prev = dmc_prev
+        self.dc_prev = dc_prev
+        self.__reset_codes()
+
+    def set_equatorial_mode(self, equatorial):
+        """
+        Sets the equatorial mode to use drying factor and day length
+        constant
+
+        Parameters
+        ----------
+        equatorial : bool
+            enable equatorial mode
+
+        Returns
+        -------
+        None
+        """
+        self.equatorial = equatorial
+        self.__reset_codes()
+
+    def calculate_fine_fuel_moisture_code(self):
+        self.ffmc = self._run(ffmc_kernel, self.inputs.temp, \
+            self.inputs.rhum, self.inputs.wind, self.inputs.rain, \
+            self.ffmc_prev)
+
+    def calculate_duff_moisture_code(self):
+        self.dmc = self._run(dmc_kernel, self.inputs.temp, \
+            self.inputs.rhum, self.inputs.rain, self.dmc_prev, \
+            self._day_length())
+
+    def calculate_drought_code(self):
+        self.dc = self._run(dc_kernel, self.inputs.temp, \
+            self.inputs.rain, self.dc_prev, self._drying_factor())
+
+    def calculate_initial_spread_index(self):
+        self.isi = self._run(isi_kernel, self.inputs.wind, \
+            self._ensure('ffmc'))
+
+    def calculate_buildup_index(self):
+        self.bui = self._run(bui_kernel, self._ensure('dmc'), \
+            self._ensure('dc'))
+
+    def calculate_fire_weather_index(self):
+        self.fwi = self._run(fwi_kernel, self._ensure('isi'), \
+            self._ensure('bui'))
+
+    def compute(self):
+        """
+        Calculates all the Fire Weather Indices
+
+        Returns
+        -------
+        fwi : numpy.ndarray
+            observed date's fire weather index
+        """
+        for name in self._CALCULATORS:
+            self._ensure(name)
+        return self.fwi
+
+    def compute_xarray(self, ds):
+        """
+        Calculates all six Fire Weather Indices for an xarray.Dataset,
+        chunk by chunk when it is backed by dask, starting from the
+        previous codes set on this calculator as scalars or
+        xarray.DataArray
+
+        Parameters
+        ----------
+        ds : xarray.Dataset
+            daily weather inputs at noon as T, H, W and R variables,
+            with a latitude coordinate outside equatorial mode
+
+        Returns
+        -------
+        codes : xarray.Dataset
+            the six codes named as the FWICalculator bands
+        """
+        import xarray as xr
+
+        # Cast at ingress, so no float64 variable enters the kernels
+        ds = ds.astype(np.float32)
+
+        def run(kernel, *arrays):
+            # Cast every argument to the float32 of the kernel
+            # signatures, apply_ufunc broadcasts them element-wise
+            arrays = [array.astype(np.float32) \
+                if isinstance(array, xr.DataArray) else np.float32(array) \
+                for array in arrays]
+            return xr.apply_ufunc(kernel, *arrays, \
+                dask = 'parallelized', output_dtypes = [np.float32])
+
+        def monthly(equatorial_value, by_latitude):
+            if self.equatorial:
+                return equatorial_value
+            return xr.apply_ufunc(by_latitude, ds['latitude'], \
+                self.obs.month - 1, dask = 'parallelized', \
+                output_dtypes = [np.float32])
+
+        ffmc = run(ffmc_kernel, ds['T'], ds['H'], ds['W'], ds['R'], \
+            self.ffmc_prev)
+        dmc = run(dmc_kernel, ds['T'], ds['H'], ds['R'], self.dmc_prev, \
+            monthly(9.0, _day_length_by_latitude))
+        dc = run(dc_kernel, ds['T'], ds['R'], self.dc_prev, \
+            monthly(1.39, _drying_factor_by_latitude))
+        isi = run(isi_kernel, ds['W'], ffmc)
+        bui = run(bui_kernel, dmc, dc)
+        fwi = run(fwi_kernel, isi, bui)
+
+        return xr.Dataset({
+            'fine_fuel_moisture_code': ffmc,
+            'duff_moisture_code': dmc,
+            'drought_code': dc,
+            'initial_spread_index': isi,
+            'buildup_index': bui,
+            'fire_weather_index': fwi})
+
+    def get_fwi_codes(self):
+        """
+        Return a single array with all six Fire Weather Indices
+        stacked on the first axis, in the order of FWICalculator bands
+        """
+        return np.stack([self._ensure(name) for name in self._CALCULATORS])
+
+    def get_fwi_codes_int16(self):
+        """
+        Return get_fwi_codes as int16 fixed-point values, the codes
+        times INT16_SCALE, for half the storage of the float32 codes.
+        NaN codes, e.g. from missing inputs, become the int16 minimum
+        """
+        info = np.iinfo(np.int16)
+        codes = np.rint(self.get_fwi_codes() * self.INT16_SCALE)
+        codes = np.clip(codes, info.min + 1, info.max)
+        return np.where(np.isnan(codes), info.min, codes).astype(np.int16)
+
+    def update_inputs(self, inputs):
+        """
+        Updates the daily inputs required to calculate next day's
+        Fire Weather Indices
+
+        Parameters
+        ----------
+        inputs : FWIInputs
+            next daily observed weather inputs at noon as numpy arrays
+        """
+        self.ffmc_prev = self._ensure('ffmc')
+        self.dmc_prev = self._ensure('dmc')
+        self.dc_prev = self._ensure('dc')
+        self.__reset_codes()
+
+        self.obs = self.obs + datetime.timedelta(days=1)
+        self.inputs = inputs
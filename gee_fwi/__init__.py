@@ -0,0 +1,25 @@
+# Earth Engine endpoint for many concurrent, non-interactive requests
+HIGH_VOLUME_URL = 'https://earthengine-highvolume.googleapis.com'
+
+def initialize(high_volume = True, **kwargs):
+    """
+    Initializes the Earth Engine client, on the high-volume endpoint by
+    default so the tile and export requests made for many days of
+    inputs are not latency bound. Call it once instead of
+    ee.Initialize(), initializing again on the default endpoint routes
+    every later request there
+
+    Parameters
+    ----------
+    high_volume : bool
+        use the high-volume endpoint
+    kwargs : dict
+        other arguments passed to ee.Initialize, e.g. credentials or
+        project
+    """
+    # Imported here so gee_fwi.FWINumpy stays usable without ee
+    import ee
+
+    if high_volume:
+        kwargs.setdefault('url', HIGH_VOLUME_URL)
+    ee.Initialize(**kwargs)
@@ -18,5 +18,9 @@ setup(name = 'gee_fwi',
         'earthengine-api',
         'eemont',
     ],
+    extras_require = {
+        'numpy': ['numpy', 'numba'],
+        'xarray': ['numpy', 'numba', 'xarray'],
+    },
     include_package_data = True,
     zip_safe = False)
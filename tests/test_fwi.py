@@ -0,0 +1,81 @@
+import copy
+import datetime
+import types
+from unittest import mock
+
+import pytest
+
+ee = pytest.importorskip('ee')
+pytest.importorskip('eemont')
+
+from gee_fwi.FWI import FWICalculator, make_calculator
+
+class FakeImage:
+    """
+    Stands in for ee.Image, which needs an initialized client, and
+    records what each image was built from
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def select(self, band):
+        return FakeImage((self.value, band))
+
+@pytest.fixture(autouse = True)
+def fake_image():
+    with mock.patch.object(ee, 'Image', FakeImage):
+        yield
+
+OBS = datetime.date(2021, 8, 1)
+
+def test_make_calculator_returns_the_ee_calculator():
+    calculator = make_calculator(OBS, object())
+
+    assert isinstance(calculator, FWICalculator)
+    assert copy.copy(calculator).obs == OBS
+    assert copy.deepcopy(calculator).ffmc_prev.value == 85.0
+
+def test_make_calculator_returns_the_numpy_calculator():
+    pytest.importorskip('numba')
+    from gee_fwi.FWINumpy import FWICalculatorNumpy
+
+    calculator = make_calculator(OBS, object(), equatorial = False, \
+        backend = 'numpy', latitude = 45.0)
+    assert isinstance(calculator, FWICalculatorNumpy)
+    assert calculator.latitude == 45.0
+
+def test_make_calculator_rejects_unknown_arguments():
+    with pytest.raises(ValueError):
+        make_calculator(OBS, object(), backend = 'torch')
+    with pytest.raises(TypeError):
+        make_calculator(OBS, object(), latitude = 45.0)
+
+def test_restore_previous_codes_moves_to_the_next_day():
+    today, tomorrow = object(), object()
+    calculator = FWICalculator(OBS, today)
+    calculator.restore_previous_codes('users/fwi/codes', tomorrow)
+
+    assert calculator.obs == OBS + datetime.timedelta(days = 1)
+    assert calculator.inputs is tomorrow
+    assert calculator.ffmc_prev.value == \
+        ('users/fwi/codes', 'fine_fuel_moisture_code')
+    assert calculator.dmc_prev.value == \
+        ('users/fwi/codes', 'duff_moisture_code')
+    assert calculator.dc_prev.value == ('users/fwi/codes', 'drought_code')
+
+    # The restored codes are yesterday's for the next day's weather
+    with mock.patch('gee_fwi.FWI.FineFuelMoistureCode') as ffmc:
+        calculator.calculate_fine_fuel_moisture_code()
+    ffmc.assert_called_once_with(tomorrow, calculator.ffmc_prev)
+
+def test_restore_previous_codes_keeps_the_current_inputs():
+    tomorrow = object()
+    calculator = FWICalculator(OBS, tomorrow)
+    calculator.restore_previous_codes('users/fwi/codes')
+
+    assert calculator.obs == OBS
+    assert calculator.inputs is tomorrow
+    assert calculator.ffmc is None
+    assert calculator.ffmc_prev.value == \
+        ('users/fwi/codes', 'fine_fuel_moisture_code')
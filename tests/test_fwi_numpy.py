@@ -0,0 +1,122 @@
+import datetime
+import types
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('numba')
+
+from gee_fwi.FWINumpy import FWICalculatorNumpy, ffmc_kernel, \
+    dmc_kernel, dc_kernel, isi_kernel, bui_kernel, fwi_kernel
+
+# Daily T, H, W and R from April 13 of the Van Wagner and Pickett
+# (1985) test table, starting from FFMC 85, DMC 6 and DC 15
+WEATHER = [
+    (17.0, 42.0, 25.0, 0.0),
+    (20.0, 21.0, 25.0, 2.4),
+    ( 8.5, 40.0, 17.0, 0.0),
+    ( 6.5, 25.0,  6.0, 0.0),
+    (13.0, 34.0, 24.0, 0.0),
+]
+
+# FFMC, DMC, DC, ISI, BUI and FWI published for each day above
+CODES = [
+    (87.7,  8.5, 19.0, 10.9,  8.5, 10.1),
+    (86.2, 10.4, 23.6,  8.8, 10.4,  9.3),
+    (87.0, 11.8, 26.1,  6.5, 11.7,  7.6),
+    (88.8, 13.2, 28.2,  4.9, 13.1,  6.2),
+    (89.1, 15.4, 31.5, 12.6, 15.3, 14.8),
+]
+
+NAMES = ['ffmc', 'dmc', 'dc', 'isi', 'bui', 'fwi']
+
+# April day length and drying factor of the table, north of 33N
+DAY_LENGTH = 12.8
+DRYING_FACTOR = 0.9
+
+def f4(*values):
+    return np.array(values, dtype = np.float32)
+
+def inputs(temp, rhum, wind, rain, dtype = np.float32):
+    return types.SimpleNamespace(temp = np.array([temp], dtype = dtype), \
+        rhum = np.array([rhum], dtype = dtype), \
+        wind = np.array([wind], dtype = dtype), \
+        rain = np.array([rain], dtype = dtype))
+
+def test_kernels_match_the_first_day():
+    T, H, W, R = (f4(value) for value in WEATHER[0])
+    ffmc, dmc, dc, isi, bui, fwi = CODES[0]
+
+    assert ffmc_kernel(T, H, W, R, f4(85.0))[0] == \
+        pytest.approx(ffmc, abs = 0.05)
+    assert dmc_kernel(T, H, R, f4(6.0), f4(DAY_LENGTH))[0] == \
+        pytest.approx(dmc, abs = 0.05)
+    assert dc_kernel(T, R, f4(15.0), f4(DRYING_FACTOR))[0] == \
+        pytest.approx(dc, abs = 0.05)
+    assert isi_kernel(W, f4(ffmc))[0] == pytest.approx(isi, abs = 0.1)
+    assert bui_kernel(f4(dmc), f4(dc))[0] == pytest.approx(bui, abs = 0.1)
+    assert fwi_kernel(f4(isi), f4(bui))[0] == pytest.approx(fwi, abs = 0.1)
+
+# DMC, DC and BUI, the first day of the table and codes whose
+# unclamped BUI is negative or undefined
+BUILDUP = [
+    (8.5, 19.0, 8.5),
+    (0.5,  0.0, 0.0),
+    (0.0,  0.0, 0.0),
+]
+
+@pytest.mark.parametrize('dmc, dc, bui', BUILDUP)
+def test_bui_kernel_is_never_negative(dmc, dc, bui):
+    assert bui_kernel(f4(dmc), f4(dc))[0] == pytest.approx(bui, abs = 0.1)
+    assert np.isfinite(fwi_kernel(f4(5.0), bui_kernel(f4(dmc), f4(dc))))
+
+def test_int16_codes_mark_nan():
+    calculator = FWICalculatorNumpy(datetime.date(1985, 4, 13), \
+        inputs(*WEATHER[0]), equatorial = False, latitude = 45.0)
+    calculator.inputs.rhum[0] = np.nan
+
+    with np.errstate(invalid = 'ignore'):
+        codes = calculator.get_fwi_codes_int16()
+    assert codes[0, 0] == np.iinfo(np.int16).min
+    assert codes[2, 0] == round(CODES[0][2] * calculator.INT16_SCALE)
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_compute_follows_the_reference_series(dtype):
+    calculator = FWICalculatorNumpy(datetime.date(1985, 4, 13), \
+        inputs(*WEATHER[0], dtype = dtype), equatorial = False, \
+        latitude = np.array([45.0], dtype = dtype))
+
+    for day, expected in enumerate(CODES):
+        assert calculator.compute()[0] == \
+            pytest.approx(expected[-1], abs = 0.05)
+        for name, value in zip(NAMES, expected):
+            assert getattr(calculator, name)[0] == \
+                pytest.approx(value, abs = 0.05), (day, name)
+        if day + 1 < len(WEATHER):
+            calculator.update_inputs(inputs(*WEATHER[day + 1], \
+                dtype = dtype))
+
+@pytest.mark.parametrize('equatorial', [True, False])
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_compute_xarray_matches_compute(dtype, equatorial):
+    xr = pytest.importorskip('xarray')
+
+    # One reference day per column, repeated in every latitude band
+    latitude = np.array([50.0, 10.0, -10.0, -40.0], dtype = dtype)
+    weather = np.broadcast_to(np.array(WEATHER, dtype = dtype).T[:, None], \
+        (4, latitude.size, len(WEATHER)))
+    ds = xr.Dataset({band: (('latitude', 'x'), values) \
+        for band, values in zip('THWR', weather)}, \
+        coords = {'latitude': latitude})
+
+    calculator = FWICalculatorNumpy(datetime.date(1985, 4, 13), \
+        types.SimpleNamespace(temp = weather[0], rhum = weather[1], \
+        wind = weather[2], rain = weather[3]), equatorial = equatorial, \
+        latitude = latitude[:, None])
+    codes = calculator.compute_xarray(ds)
+    calculator.compute()
+
+    for name, band in zip(NAMES, codes.data_vars):
+        assert codes[band].dtype == np.float32
+        np.testing.assert_allclose(codes[band].values, \
+            getattr(calculator, name), rtol = 1e-6)